@@ -17,7 +17,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import signal, sys
+import signal, sys, os
 import time
 import json
 from datetime import datetime, timedelta
@@ -29,6 +29,7 @@ from queue import Queue
 
 import PMU
 from wavewrite import WaveWrite
+from qualitylog import QualityLog
         
         
 # ###################################
@@ -41,8 +42,18 @@ def get_PMU(queue_out, IP, Port):
     
     global stopThread
     # Set up an instance of the PMU Sampled Value receiver
+    # Retry until the network is ready (e.g. interface still coming up at boot)
     
-    pmu = PMU.Receiver(IP, Port, forward=False)  
+    pmu = None
+    while pmu is None and not stopThread:
+        try:
+            pmu = PMU.Receiver(IP, Port, forward=False)
+        except OSError as e:
+            print("> Waiting for network:", e)
+            time.sleep(1)
+    
+    if pmu is None:
+        return
     
     while not stopThread:      
         
@@ -82,13 +93,90 @@ def signal_handler(signal, frame):
     print('You pressed Ctrl+C!')
     time.sleep(1)
     # pmu.close()
-    waveOut.close()
+    if waveOut is not None:     # No file yet if still waiting for the network/first frame
+        waveOut.close()
+    if qualityLog is not None:
+        qualityLog.close()
     # sys.exit(0)
+
+# Hangup event handler (kill -HUP to reload config.json at next file boundary)
+def reload_handler(signal, frame):
+    
+    global reloadPending
+    
+    reloadPending = True
+    print('SIGHUP received, config will be reloaded at next file boundary')
     
 # Load the config file    
 def loadConfig(configFile="config.json"):
     with open(configFile) as jsonFile:
         return json.load(jsonFile)
+
+# Get the modification time of the config file, None if it can't be read
+def getConfigMtime(configFile="config.json"):
+    try:
+        return os.path.getmtime(configFile)
+    except OSError:
+        return None
+
+# Reload the config file, keeping the current config if the new one is unusable
+def reloadConfig(configFile, config):
+    
+    try:
+        newConfig = loadConfig(configFile)
+    except (OSError, ValueError) as e:
+        print("> Config reload failed, keeping current settings:", e)
+        return config
+    
+    missing = [key for key in config if key not in newConfig]
+    if len(missing) > 0:
+        print("> Config reload failed, missing keys:", missing)
+        return config
+    
+    problems = checkRecSettings(newConfig)
+    if len(problems) > 0:
+        print("> Config reload failed, keeping current settings:", problems)
+        return config
+    
+    # The receiver socket is only set up once, so these need a restart
+    for key in ("recvIP", "recvPort"):
+        if newConfig[key] != config[key]:
+            print("> Config: change to '%s' requires a restart, ignored" % key)
+            newConfig[key] = config[key]
+    
+    print("> Config reloaded:", newConfig)
+    return newConfig
+
+# Check the recording settings are usable, returns a list of problems (empty if OK)
+def checkRecSettings(config):
+    
+    problems = []
+    
+    recMask = config["recMask"]
+    if (not isinstance(recMask, list) or len(recMask) == 0
+            or not all(type(channel) is int and channel in range(PMU.Receiver.CH_NUMBER) for channel in recMask)):
+        problems.append("recMask must be a non-empty list of channels 0-%d" % (PMU.Receiver.CH_NUMBER - 1))
+    
+    daysToKeep = config["daysToKeep"]
+    if type(daysToKeep) is not int or daysToKeep < 0:
+        problems.append("daysToKeep must be a non-negative integer")
+    
+    wavePath = config["wavePath"]
+    if not isinstance(wavePath, str) or not wavePath.endswith("/"):
+        problems.append("wavePath must be a directory ending in '/'")
+    else:
+        try:
+            os.makedirs(wavePath, exist_ok=True)
+            if not os.access(wavePath, os.W_OK):
+                problems.append("wavePath is not writable")
+        except OSError as e:
+            problems.append("wavePath can't be created: %s" % e)
+    
+    return problems
+
+# Get the recording settings which may be changed while running
+def getRecSettings(config):
+    return config["wavePath"], config["recMask"], config["allowDeletion"], config["daysToKeep"]
     
 # Get the SV format data from OpenPMU ADC stream
 def getSVFormat(dataInfo):
@@ -168,6 +256,9 @@ def deleteOldRecords(filePath, daysToKeep, dateNow):
     
     for path in glob.glob(filePath + "*"):
         
+        if path.split('/')[-1] == "QualityLogs":                                # Daily log files, handled below
+            continue
+        
         try:
             dateStr = path.split('/')[-1]
             date = datetime.strptime(dateStr, "%Y-%m-%d").date()
@@ -181,15 +272,43 @@ def deleteOldRecords(filePath, daysToKeep, dateNow):
             print(path, "--- Path deleted")
         else:
             print(path, " --- Path retained")
+    
+    # Quality logs are kept for the same number of days as the wave files
+    for path in glob.glob(filePath + "QualityLogs/*.qlog"):
+        
+        try:
+            dateStr = path.split('/')[-1][0:10]
+            date = datetime.strptime(dateStr, "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        
+        if date < deleteEpoch:
+            os.remove(path)
+            print(path, "--- Quality log deleted")
 
 # ####################################
 # --------------- MAIN ---------------
 if __name__ == '__main__':
     
     # Keyboard interrupt
+    waveOut = None
+    qualityLog = None
     signal.signal(signal.SIGINT, signal_handler)
+    
+    # Config reload (SIGHUP not available on Windows, file watching still works)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload_handler)
 
-    config = loadConfig("config.json")
+    configFile = "config.json"
+    config = loadConfig(configFile)
+    configMtime = getConfigMtime(configFile)
+    
+    # Same rules as a reload, better to stop now than crash mid-recording
+    problems = checkRecSettings(config)
+    if len(problems) > 0:
+        print("> Config error:", problems)
+        sys.exit(1)
+    reloadPending = False
     
     wavePath        = config["wavePath"]
     recvIP          = config["recvIP"]
@@ -204,6 +323,7 @@ if __name__ == '__main__':
 
     waveBuffer = np.zeros((8, 15360))
     SVformat = {}
+    qualityLog = QualityLog(PMU.Receiver.ADC_MAX_VALUE)     # Per second data quality records
     
     print("OpenPMU - Sampled Value (SV) to WAVE file Writer")
     
@@ -259,7 +379,7 @@ if __name__ == '__main__':
             # Set up instance of WaveWrite    
             waveBuffer = np.zeros((len(recMask), Fs))
 
-            waveOut = WaveWrite(frameTime, SVformat["Fs"], len(recMask), wavePath, waveInterval, waveFrmt)  # Create new waveOut
+            waveOut = WaveWrite(frameTime, SVformat["Fs"], len(recMask), wavePath, waveInterval, waveFrmt, qualityLog)  # Create new waveOut
             
             # Print progress bar header, force special case for first file
             printProgressHeader(waveOut.waveTime, frameTime, forceHeader=True)
@@ -275,6 +395,7 @@ if __name__ == '__main__':
 
         # Check for discontinuities
         period = (frameTime - preFrameTime).total_seconds()        
+        frameLate = period < validPeriod                                                # Repeated or out of order frame
         if period != validPeriod:
             
             # Discontinuties are classed into the following type
@@ -293,8 +414,14 @@ if __name__ == '__main__':
                 waveOut.append(waveBuffer)                                                  # Write out existing waveBuffer
                 waveOut.finalise()                                                          # Finalise old file
                 
+                # Apply any pending config change now that the old file is closed
+                if reloadPending:
+                    reloadPending = False
+                    config = reloadConfig(configFile, config)
+                    wavePath, recMask, allowDeletion, daysToKeep = getRecSettings(config)
+                
                 print(">>>>", frameTime, waveFileTime)
-                waveOut = WaveWrite(frameTime, SVformat["Fs"], len(recMask), wavePath, waveInterval, waveFrmt)  # Create new waveOut
+                waveOut = WaveWrite(frameTime, SVformat["Fs"], len(recMask), wavePath, waveInterval, waveFrmt, qualityLog)  # Create new waveOut
                 waveBuffer = np.zeros((len(recMask), Fs))                                 # Create new empty waveBuffer
                 
             elif frameTime.second == preFrameTime.second:
@@ -332,6 +459,12 @@ if __name__ == '__main__':
                     print('|', end='', flush=True)
                 else:
                     print('.', end='', flush=True)
+                
+                # Watch the config file, once per second is plenty
+                newMtime = getConfigMtime(configFile)
+                if newMtime != configMtime:
+                    configMtime = newMtime
+                    reloadPending = True
 
             
             ####  THIS NOTE NEEDS UPDATED....            
@@ -347,7 +480,15 @@ if __name__ == '__main__':
             # Else check for minute rollover to update console
             if waveFileTime != waveOut.waveTime:             
                 waveOut.finalise()                                                      # Close existing waveOut
-                waveOut = WaveWrite(waveFileTime, SVformat["Fs"], len(recMask), wavePath, waveInterval, waveFrmt)  # Create new waveOut
+                
+                # Apply any pending config change now that the old file is closed
+                if reloadPending:
+                    reloadPending = False
+                    config = reloadConfig(configFile, config)
+                    wavePath, recMask, allowDeletion, daysToKeep = getRecSettings(config)
+                    waveBuffer = np.zeros((len(recMask), Fs))                         # recMask may have changed
+                
+                waveOut = WaveWrite(waveFileTime, SVformat["Fs"], len(recMask), wavePath, waveInterval, waveFrmt, qualityLog)  # Create new waveOut
                 print('')                                                               # Add a line break
                 printProgressHeader(waveOut.waveTime, frameTime)                        # Print heartbeat debug info
             elif frameTime.minute != preFrameTime.minute:
@@ -365,6 +506,7 @@ if __name__ == '__main__':
         recBuffer = getSVs(dataInfo, recMask)                                           # Get the SVs to record        
         thisFrame = dataInfo['Frame']                                                   # Get the frame number of this frame
         waveBuffer[0:len(recBuffer),128*thisFrame:128*(thisFrame+1)] = recBuffer        # Add the SVs to the 1 second buffer
+        qualityLog.countFrame(frameLate)                                                # Count frames in this second
         
     t.join()
     print("Programme ended.")
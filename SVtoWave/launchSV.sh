@@ -1,15 +1,13 @@
 #!/bin/bash
 
 path="$(dirname "$(realpath "$0")")";
-initSleep=30
 script="SVtoWave.py"
 
 
 echo PATH: $path
 cd $path
 
-echo Initial sleep, give time for system to boot
-sleep $initSleep
+# No initial sleep needed, SVtoWave waits for the network itself
 
 echo Starting loop
 
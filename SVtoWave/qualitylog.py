@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+OpenPMU - qualitylog
+Copyright (C) 2022  www.OpenPMU.org
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import numpy as np
+
+
+# QualityLog keeps a compact binary record of the data quality for each second
+# written to the WAVE files.  Records are fixed size and appended to one file
+# per day, stored as "<wavePath>/QualityLogs/YYYY-MM-DD.qlog".  Old logs are
+# deleted along with old WAVE folders, using the same 'daysToKeep'.
+#
+# The files have no header, so can be read in bulk with readQualityLog(), or
+# directly with np.memmap(path, dtype=QLOG_DTYPE, mode='r').
+#
+# When a wave file is (re)opened, the log is truncated back to the end of the
+# audio kept in that file, so each second has a single record matching the audio.
+#
+# Padded seconds get a record with frames=0.  Clip counts are in the order of
+# the recorded channels (i.e. recMask), unused channels are zero.
+
+QLOG_CHANNELS = 8       # Max channels, same as PMU.Receiver.CH_NUMBER
+
+QLOG_DTYPE = np.dtype([
+    ('time',     '<M8[s]'),                     # Time of the second recorded (UTC)
+    ('frames',   '<u2'),                        # Frames received
+    ('late',     '<u2'),                        # Frames late or out of order
+    ('padded',   '<u4'),                        # Samples padded (per channel)
+    ('latency',  '<f4'),                        # Write latency in seconds
+    ('channels', 'u1'),                         # Number of channels recorded
+    ('clipped',  '<u4', (QLOG_CHANNELS,)),      # Clipped samples per channel
+])
+
+# Read a quality log as a memory mapped array of records
+def readQualityLog(logFilePath):
+
+    records = os.path.getsize(logFilePath) // QLOG_DTYPE.itemsize     # Ignore any partly written record
+    if records == 0:
+        return np.zeros(0, dtype=QLOG_DTYPE)
+    return np.memmap(logFilePath, dtype=QLOG_DTYPE, mode='r', shape=(records,))
+
+# ############################################
+# ------------- QualityLog Class -------------
+
+class QualityLog:
+
+    def __init__(self, clipLevel):
+
+        # clipLevel     - SV magnitude at or above which a sample is counted as clipped
+
+        self.clipLevel   = clipLevel
+        self.logFile     = None
+        self.logFilePath = None
+
+        # Counters for the second presently being buffered, reset after each record
+        self.frames     = 0
+        self.late       = 0
+
+    # Count a frame received for the second presently being buffered
+    def countFrame(self, late=False):
+
+        self.frames += 1
+        if late:
+            self.late += 1
+
+    # Write a record for a second of SVs appended to the wave file
+    def write(self, wavePath, recordTime, samples, latency):
+
+        # samples is (channels, Fs) as passed to WaveWrite.append()
+        record = np.zeros(1, dtype=QLOG_DTYPE)
+        record['time']      = np.datetime64(recordTime, 's')
+        record['frames']    = self.frames
+        record['late']      = self.late
+        record['latency']   = latency
+        record['channels']  = len(samples)
+
+        clipped = np.count_nonzero((samples >= self.clipLevel) | (samples <= -self.clipLevel), axis=1)
+        record['clipped'][0, 0:len(clipped)] = clipped[0:QLOG_CHANNELS]
+
+        self.writeRecord(wavePath, recordTime, record)
+        self.frames = 0
+        self.late   = 0
+
+    # Write a record for each padded second
+    def pad(self, wavePath, recordTime, padSeconds, sampleRate, channels):
+
+        record = np.zeros(padSeconds, dtype=QLOG_DTYPE)
+        record['time']      = np.datetime64(recordTime, 's') + np.arange(padSeconds)
+        record['padded']    = sampleRate
+        record['channels']  = channels
+
+        self.writeRecord(wavePath, recordTime, record)
+
+    # Remove records at or after fromTime from that day's log, e.g. when a wave file is overwritten
+    def truncate(self, wavePath, fromTime):
+
+        logFilePath = wavePath + "QualityLogs/" + fromTime.strftime("%Y-%m-%d") + ".qlog"
+        if not os.path.exists(logFilePath):
+            return
+
+        log = readQualityLog(logFilePath)
+        later = log['time'] >= np.datetime64(fromTime, 's')
+        keep = int(np.argmax(later)) if later.any() else len(log)
+        del log, later                          # Release the memory map before truncating
+
+        os.truncate(logFilePath, keep * QLOG_DTYPE.itemsize)
+
+    # Append records to the log file for the day, opening a new file at midnight
+    def writeRecord(self, wavePath, recordTime, record):
+
+        if len(record) == 0:
+            return
+
+        logFilePath = wavePath + "QualityLogs/" + recordTime.strftime("%Y-%m-%d") + ".qlog"
+        if logFilePath != self.logFilePath:
+            self.close()
+            self.ensureDir(logFilePath)
+            self.logFile = open(logFilePath, 'ab')
+            self.logFilePath = logFilePath
+
+        self.logFile.write(record.tobytes())
+        self.logFile.flush()                    # So readers see whole seconds
+
+    # Close the log file
+    def close(self):
+        if self.logFile is not None:
+            self.logFile.close()
+            self.logFile = None
+            self.logFilePath = None
+
+    # Ensure the path to the log file exists, if not create the path
+    def ensureDir(self, filePath):
+        directory = os.path.dirname(filePath)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
@@ -19,6 +19,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import soundfile as sf
 import os
+import time
 import numpy as np
 from datetime import datetime, timedelta
 
@@ -33,25 +34,31 @@ from datetime import datetime, timedelta
 #
 # Presently, assumes that SVs are in int16 format.  Fair since that's the only
 # model of OpenPMU ADC which exists.
+#
+# If a QualityLog is given, a record is written to it for each second appended
+# or padded.
 
 # ###########################################
 # ------------- FlacWrite Class -------------
 
 class WaveWrite:
     
-    def __init__(self, waveTime, sampleRate, channels, wavePath="", waveMinutes=1, frmt='wav'):
+    def __init__(self, waveTime, sampleRate, channels, wavePath="", waveMinutes=1, frmt='wav', qualityLog=None):
         
         # waveTime      - datetime of the wave file to be created/written to
         # sampleRate    - sampling rate (Fs) of the SV data
         # channels      - number of channels to record
         # wavePath      - directory in which to store WAVE files
         # waveMinutes   - minutes between files (i.e. new file interval)
+        # qualityLog    - optional QualityLog to record per second data quality
         
         # self.waveTime       = waveTime.replace(second=0, microsecond=0)
         self.waveTime       = self.floorTime(waveTime, waveMinutes)
         self.sampleRate     = sampleRate
         self.channels       = channels
         self.waveMinutes    = waveMinutes
+        self.wavePath       = wavePath
+        self.qualityLog     = qualityLog
               
         # Sets up the filename and path
         # Format is <configPath>/YYYY-MM-DD/<waveFile>        
@@ -75,6 +82,10 @@ class WaveWrite:
         
         # print(". WAVE_Length", self.waveLength) # Debug
         
+        # Drop any quality records for the part of the file just overwritten (e.g. FLAC after a restart)
+        if self.qualityLog is not None:
+            self.qualityLog.truncate(self.wavePath, self.waveTime + timedelta(seconds=self.waveLength))
+        
         # Pad the newly opened file so that it is the correct length to start appending new data
         # That is, the new data should be appended such that it is the correct time after file time stamp
         initialPad = int((waveTime - self.waveTime).total_seconds() - self.waveLength)
@@ -84,8 +95,14 @@ class WaveWrite:
     # Append SVs to the wave file.    
     def append(self, samples):
         
-        samples = np.ascontiguousarray(samples.copy().transpose(), dtype=np.int16)
-        self.waveFile.buffer_write( samples, dtype='int16' )
+        recordTime = self.waveTime + timedelta(seconds=self.getLength())
+        writeStart = time.perf_counter()
+        
+        samplesOut = np.ascontiguousarray(samples.copy().transpose(), dtype=np.int16)
+        self.waveFile.buffer_write( samplesOut, dtype='int16' )
+        
+        if self.qualityLog is not None:
+            self.qualityLog.write(self.wavePath, recordTime, samples, time.perf_counter() - writeStart)
         # print("POS: ", self.getLength() )
         
     # Pad the wave file by desired number of seconds    
@@ -93,6 +110,11 @@ class WaveWrite:
         
         # print("PAD: ", padSeconds) # Debug
         self.padSeconds = padSeconds
+        
+        if self.qualityLog is not None and padSeconds > 0:
+            recordTime = self.waveTime + timedelta(seconds=self.getLength())
+            self.qualityLog.pad(self.wavePath, recordTime, padSeconds, self.sampleRate, self.channels)
+        
         waveEmpty = np.ones((self.channels, (self.sampleRate * padSeconds)))        
         
         samples = np.ascontiguousarray((waveEmpty).copy().transpose(), dtype=np.int16)